@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 from datetime import time, date, datetime
-import itertools
+from functools import partial
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import monotonic
 from supabase import create_client, Client
 import boto3
+from botocore.config import Config
 from io import StringIO, BytesIO
 
 # --- Configuración de la Página ---
@@ -34,31 +39,31 @@ def init_connection():
         endpoint_url=s3_endpoint_url,
         aws_access_key_id=s3_access_key,
         aws_secret_access_key=s3_secret_key,
-        region_name=s3_region
+        region_name=s3_region,
+        # Conexiones TCP reutilizables y reintentos estándar ante fallos transitorios de S3
+        config=Config(tcp_keepalive=True, retries={'max_attempts': 3, 'mode': 'standard'})
     )
     return supabase_db, s3_client
 
 supabase, s3 = init_connection()
 
 # --- Utilidades de lectura desde S3 ---
-@st.cache_data(ttl=300)
 def load_s3_csv(bucket_name, file_key):
     """Carga un archivo CSV desde un bucket S3, manejando múltiples codificaciones."""
     try:
         response = s3.get_object(Bucket=bucket_name, Key=file_key)
         csv_bytes = response['Body'].read()
+        # pandas decodifica los bytes mientras parsea, sin crear una copia del texto completo
         try:
-            csv_data = csv_bytes.decode('utf-8')
+            return pd.read_csv(BytesIO(csv_bytes), encoding='utf-8')
         except UnicodeDecodeError:
             st.warning(f"El archivo '{file_key}' no es UTF-8. Intentando con 'latin-1'.")
-            csv_data = csv_bytes.decode('latin-1')
-        return pd.read_csv(StringIO(csv_data))
+            return pd.read_csv(BytesIO(csv_bytes), encoding='latin-1')
     except Exception as e:
         st.error(f"No se pudo cargar o procesar el archivo '{file_key}' desde S3.")
         st.warning(f"Detalle del error: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def load_s3_excel(bucket_name, file_key, sheet_name=0):
     """Carga un Excel (.xlsx) desde un bucket S3."""
     try:
@@ -76,10 +81,6 @@ def load_s3_excel(bucket_name, file_key, sheet_name=0):
         st.warning(f"Detalle del error: {e}")
         return pd.DataFrame()
 
-# --- Carga Inicial de Datos Externos ---
-professors_df = load_s3_csv('Data_Cronograma', 'profesores.csv')
-raw_curriculum_df = load_s3_excel('Data_Cronograma', 'PROGRAMACION_Postgrado_v1.xlsx')
-
 # --- Normalización del currículo a los nombres esperados por la UI ---
 def parse_time_safe(val):
     if pd.isna(val):
@@ -92,10 +93,15 @@ def parse_time_safe(val):
         except Exception:
             return None
 
+def parse_time_column(values: pd.Series) -> pd.Series:
+    """Aplica parse_time_safe una sola vez por valor distinto (las horas del currículo se repiten mucho)."""
+    horas = {v: parse_time_safe(v) for v in values.dropna().unique()}
+    return values.map(horas.get)  # los vacíos quedan en None, como con apply
+
 def normalize_curriculum_df(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
-    d = df.copy()
+    d = df  # el Excel recién leído no se comparte: se normaliza en su lugar, sin copiarlo
 
     # Fechas y horas
     if 'F Reunión' in d.columns:
@@ -104,8 +110,8 @@ def normalize_curriculum_df(df: pd.DataFrame) -> pd.DataFrame:
     else:
         d['F Reunión'] = pd.NaT
 
-    d['Hora Inicio'] = d['Hora Inicio'].apply(parse_time_safe) if 'Hora Inicio' in d.columns else None
-    d['Hora Final']  = d['Hora Final'].apply(parse_time_safe)  if 'Hora Final'  in d.columns else None
+    d['Hora Inicio'] = parse_time_column(d['Hora Inicio']) if 'Hora Inicio' in d.columns else None
+    d['Hora Final']  = parse_time_column(d['Hora Final'])  if 'Hora Final'  in d.columns else None
 
     # Renombres para la UI/DB
     rename_map = {
@@ -127,7 +133,7 @@ def normalize_curriculum_df(df: pd.DataFrame) -> pd.DataFrame:
 
     # Tipos
     if 'Semestre' in d.columns:
-        d['Semestre'] = pd.to_numeric(d['Semestre'], errors='coerce').astype('Int64').astype('float').fillna(0).astype(int)
+        d['Semestre'] = pd.to_numeric(d['Semestre'], errors='coerce').fillna(0).astype(int)
     if 'Creditos' in d.columns:
         d['Creditos'] = pd.to_numeric(d['Creditos'], errors='coerce').fillna(0).astype(int)
     if '# de Catalogo' in d.columns:
@@ -139,19 +145,73 @@ def normalize_curriculum_df(df: pd.DataFrame) -> pd.DataFrame:
 
     return d
 
-curriculum_df = normalize_curriculum_df(raw_curriculum_df)
-
-# --- Catálogo de contratos permitido (desde profesores.csv) ---
-contratos_opciones = []
-if not professors_df.empty and 'Contrato' in professors_df.columns:
-    contratos_opciones = sorted(
-        professors_df['Contrato']
-        .dropna()
-        .astype(str)
-        .str.strip()
-        .unique()
-        .tolist()
-    )
+def build_curriculum_index(d: pd.DataFrame) -> dict:
+    """Agrupa el currículo en {programa: {semestre: (filas, clases únicas con etiqueta)}} para el selector de cursos."""
+    index = {}
+    if d.empty or not {'Programa', 'Semestre', 'Nombre de la clase', '# de Catalogo'} <= set(d.columns):
+        return index
+    for (programa, semestre), filas in d.groupby(['Programa', 'Semestre'], sort=True):
+        # Opciones únicas por (Nombre, #Catálogo)
+        clases = (
+            filas[['Nombre de la clase', '# de Catalogo']]
+            .dropna()
+            .drop_duplicates()
+            .sort_values(by=['Nombre de la clase', '# de Catalogo'])
+        )
+        clases['label'] = clases['Nombre de la clase'].astype(str) + ' (Catálogo ' + clases['# de Catalogo'].astype(str) + ')'
+        index.setdefault(programa, {})[semestre] = (filas, clases)
+    return index
+
+# --- Currículo normalizado persistido en disco (sobrevive reinicios del proceso) ---
+@st.cache_data(persist="disk", max_entries=2, show_spinner=False)
+def load_curriculum_version(bucket_name, file_key, etag):
+    """Descarga y normaliza el currículo; la ETag forma parte de la clave, así un archivo nuevo invalida la copia."""
+    df = load_s3_excel(bucket_name, file_key)
+    if df.empty:
+        raise ValueError(f"El currículo '{file_key}' está vacío o no se pudo leer.")  # un fallo no se persiste
+    return normalize_curriculum_df(df)
+
+def load_curriculum(bucket_name, file_key):
+    """Devuelve el currículo normalizado, reutilizando la copia en disco mientras el archivo en S3 no cambie."""
+    try:
+        etag = s3.head_object(Bucket=bucket_name, Key=file_key)['ETag']
+    except Exception:
+        return normalize_curriculum_df(load_s3_excel(bucket_name, file_key))
+    try:
+        return load_curriculum_version(bucket_name, file_key, etag)
+    except ValueError:
+        return pd.DataFrame()
+
+# --- Carga Inicial de Datos Externos (compartida entre sesiones) ---
+@st.cache_resource(ttl=300)
+def load_lookup_tables():
+    """Carga y normaliza una sola vez por proceso los datos de consulta del formulario."""
+    professors_df = load_s3_csv('Data_Cronograma', 'profesores.csv')
+    curriculum_df = load_curriculum('Data_Cronograma', 'PROGRAMACION_Postgrado_v1.xlsx')
+
+    # Catálogo de contratos permitido (desde profesores.csv)
+    contratos_opciones = []
+    if not professors_df.empty and 'Contrato' in professors_df.columns:
+        contratos_opciones = sorted(
+            professors_df['Contrato']
+            .dropna()
+            .astype(str)
+            .str.strip()
+            .unique()
+            .tolist()
+        )
+
+    # Profesores ordenados y su contrato (None si al CSV le faltan columnas)
+    profesores_catalogo = None
+    if not professors_df.empty and all(c in professors_df.columns for c in ['Profesor', 'Contrato']):
+        unique_professors = professors_df.dropna(subset=['Profesor']).drop_duplicates(subset=['Profesor'])
+        profesores_catalogo = (
+            sorted(unique_professors['Profesor'].astype(str).tolist()),
+            pd.Series(unique_professors['Contrato'].astype(str).values, index=unique_professors['Profesor'].astype(str)).to_dict()
+        )
+    return professors_df, curriculum_df, build_curriculum_index(curriculum_df), contratos_opciones, profesores_catalogo
+
+professors_df, curriculum_df, curriculum_index, contratos_opciones, profesores_catalogo = load_lookup_tables()
 
 # --- Fechas del semestre (FIJAS) ---
 SEMESTRE_INICIO = date(2026, 1, 13)
@@ -159,95 +219,422 @@ SEMESTRE_FIN    = date(2026, 6, 29)
 min_date, max_date = SEMESTRE_INICIO, SEMESTRE_FIN
 
 # --- Carga de cronograma desde DB ---
+# Columnas internas con la hora en minutos desde medianoche (int16, -1 si falta)
+COLUMNAS_MINUTOS = {'Hora de inicio': 'inicio_min', 'Hora de finalizacion': 'fin_min'}
+# 'id_base' es el ID sin el sufijo de sesión ('-S<n>'), identifica la clase completa
+# 'fecha_dia' es la Fecha como días desde 1970-01-01 (int32), para comparar y agrupar sin objetos date
+COLUMNAS_INTERNAS = list(COLUMNAS_MINUTOS.values()) + ['id_base', 'fecha_dia']
+# Columnas de baja cardinalidad usadas por filtros, validaciones y gráficos (y el contrato, repetido en cada sesión)
+COLUMNAS_CATEGORICAS = ['Programa', 'Profesor', 'Semestre', 'Nombre de la clase', 'Tipo de Contrato']
+
+# Columnas de texto: el CSV de PostgREST no trae tipos y, p. ej., '# de Catalogo' se leería como número
+COLUMNAS_TEXTO = ['ID', 'Descripción', '# de Catalogo', 'Nombre de la clase', 'Programa', 'Profesor', 'Tipo de Contrato',
+                  'Requerimientos Espacio', 'Fecha', 'Hora de inicio', 'Hora de finalizacion']
+
+def read_schedule_query(query):
+    """Ejecuta la consulta pidiendo CSV a PostgREST y lo parsea en columnas; devuelve también el total si se pidió."""
+    response = query.csv().execute()
+    if not response.data:
+        return pd.DataFrame(), response.count
+    # Los booleanos llegan en formato de registro de Postgres ('t'/'f')
+    df = pd.read_csv(StringIO(response.data), dtype={col: str for col in COLUMNAS_TEXTO},
+                     true_values=['t', 'true'], false_values=['f', 'false'])
+    return df, response.count
+
+def cast_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte a 'category' las columnas repetidas del cronograma."""
+    # Un Semestre nulo volvería float la columna (categorías 1.0, filtro 'in.(1.0)'): se conserva entero con nulos
+    if 'Semestre' in df.columns and not isinstance(df['Semestre'].dtype, pd.CategoricalDtype):
+        df['Semestre'] = pd.to_numeric(df['Semestre'], errors='coerce').astype('Int64')
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def normalize_schedule_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipifica las filas del cronograma leídas de la DB y calcula las horas en minutos."""
+    if df.empty:
+        return df
+    fechas = pd.to_datetime(df['Fecha'], format='%Y-%m-%d', cache=True)
+    df['Fecha'] = fechas.dt.date
+    df['fecha_dia'] = fechas.to_numpy().astype('datetime64[D]').astype('int32')
+    for col, min_col in COLUMNAS_MINUTOS.items():
+        horas = pd.to_datetime(df[col], format='%H:%M:%S', errors='coerce', cache=True)
+        df[col] = horas.dt.time
+        df[min_col] = (horas.dt.hour * 60 + horas.dt.minute).fillna(-1).astype('int16')
+    df['id_base'] = df['ID'].astype(str).str.rsplit('-S', n=1).str[0].astype('category')
+    return cast_categoricals(df)
+
+# Supabase limita cada respuesta de PostgREST a 1000 filas: las lecturas grandes se paginan
+PAGINA_SUPABASE = 1000
+
+# Columnas que necesita la validación de cruces (los nombres con espacios van entre comillas para PostgREST)
+COLUMNAS_CONFLICTO = ('ID,"Nombre de la clase",Fecha,"Hora de inicio","Hora de finalizacion",'
+                      'Profesor,Programa,Semestre,Simultaneo')
+
+def schedule_query(columnas='*', count=None, programas=(), profesores=(), semestres=(), fechas=(), ventana=None):
+    """Construye la consulta del cronograma con los filtros aplicados en el servidor."""
+    query = supabase.table('cronograma').select(columnas, count=count)
+    if programas:
+        query = query.in_('Programa', list(programas))
+    if profesores:
+        query = query.in_('Profesor', list(profesores))
+    if semestres:
+        query = query.in_('Semestre', list(semestres))
+    if fechas:
+        query = query.in_('Fecha', [f.isoformat() for f in fechas])
+    if ventana:
+        # Solo sesiones que se cruzan con la franja [inicio, fin) de las nuevas
+        inicio, fin = ventana
+        query = query.lt('Hora de inicio', fin.strftime('%H:%M:%S')).gt('Hora de finalizacion', inicio.strftime('%H:%M:%S'))
+    return query
+
+def session_ids_filter(bases):
+    """Expresión or_() de PostgREST que selecciona las sesiones ('<base>-S<n>') de las clases indicadas."""
+    filtros = []
+    for base in sorted(bases):
+        # La base sale del nombre libre de la clase: '%' y '_' no deben actuar como comodines del LIKE
+        patron = base.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '-S%'
+        # Dentro de comillas, PostgREST exige escapar '\' y '"'
+        filtros.append('ID.like."' + patron.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return ','.join(filtros)
+
+def read_schedule_pages(columnas='*', **filtros) -> pd.DataFrame:
+    """Lee todas las filas que cumplen los filtros; tras la primera página, el resto se pide en paralelo."""
+    def leer_pagina(inicio, count=None):
+        # Orden total y estable para que las páginas no se solapen
+        query = schedule_query(columnas, count=count, **filtros).order('Fecha').order('Hora de inicio').order('ID')
+        return read_schedule_query(query.range(inicio, inicio + PAGINA_SUPABASE - 1))
+
+    # La primera página trae también el total: sin consulta previa de conteo
+    primera, total = leer_pagina(0, count='exact')
+    paginas = [primera]
+    restantes = range(PAGINA_SUPABASE, total or 0, PAGINA_SUPABASE)
+    if restantes:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            paginas += [p for p, _ in pool.map(leer_pagina, restantes)]
+    paginas = [p for p in paginas if not p.empty]
+    return pd.concat(paginas, ignore_index=True) if paginas else pd.DataFrame()
+
 @st.cache_data(ttl=60)
-def load_schedule_data():
-    """Carga el cronograma desde la tabla 'cronograma' en Supabase."""
+def fetch_schedule_parquet(programas=(), profesores=(), semestres=()):
+    """Descarga el cronograma de Supabase (filtrado y ordenado en el servidor) y lo guarda en caché como bytes Parquet."""
+    df = read_schedule_pages(programas=programas, profesores=profesores, semestres=semestres)
+    buffer = BytesIO()
+    normalize_schedule_df(df).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def load_schedule_data(programas=(), profesores=(), semestres=()):
+    """Carga desde Supabase una vista filtrada del cronograma (cacheada como Parquet)."""
     try:
-        response = supabase.table('cronograma').select('*').execute()
-        df = pd.DataFrame(response.data)
-        if not df.empty:
-            df['Fecha'] = pd.to_datetime(df['Fecha']).dt.date
-            df['Hora de inicio'] = pd.to_datetime(df['Hora de inicio'], format='%H:%M:%S', errors='coerce').dt.time
-            df['Hora de finalizacion'] = pd.to_datetime(df['Hora de finalizacion'], format='%H:%M:%S', errors='coerce').dt.time
-        return df
+        # Parquet no conserva las categorías numéricas (Semestre): se reaplican al leer
+        return cast_categoricals(pd.read_parquet(BytesIO(fetch_schedule_parquet(programas, profesores, semestres))))
     except Exception as e:
         st.error(f"Error de conexión con Supabase DB: No se pudo encontrar la tabla 'cronograma'. Detalle: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
-def get_unique_values_from_db(column_name):
-    """Obtiene valores únicos para filtros directamente de la base de datos."""
-    try:
-        response = supabase.table('cronograma').select(column_name).execute()
-        if response.data:
-            return sorted(list(set(item[column_name] for item in response.data if item[column_name] is not None)))
-        return []
-    except Exception:
+def fetch_schedule_for_dates(fechas, ventana=None):
+    """Trae de Supabase solo las columnas y sesiones candidatas (mismas fechas y franja horaria) para validar cruces."""
+    return normalize_schedule_df(read_schedule_pages(COLUMNAS_CONFLICTO, fechas=tuple(fechas), ventana=ventana))
+
+def append_schedule_rows(df, rows):
+    """Devuelve el cronograma con las filas recién insertadas, normalizadas y en orden de fecha y hora."""
+    nuevas = normalize_schedule_df(pd.DataFrame(rows))
+    df = pd.concat([df, nuevas], ignore_index=True).sort_values(['fecha_dia', 'inicio_min'], kind='stable', ignore_index=True)
+    # concat de categóricas con categorías distintas devuelve object: se vuelven a tipificar
+    df['id_base'] = df['id_base'].astype('category')
+    return cast_categoricals(df)
+
+def get_filter_options(df, column_name):
+    """Opciones de filtro a partir de las categorías ya calculadas del cronograma cargado."""
+    if column_name not in df.columns:
         return []
+    return df[column_name].cat.categories.tolist()
+
+# Tras un fallo de lectura no se reintenta durante este tiempo (evita repetir el timeout en cada rerun)
+ESPERA_REINTENTO_SEG = 30
+
+@st.cache_resource(ttl=60)
+def schedule_store():
+    """Cronograma compartido por todas las sesiones del proceso (una sola copia en memoria)."""
+    return {'df': None, 'lock': threading.Lock(), 'carga': threading.Lock(), 'opciones_eliminar': None,
+            'fallo_hasta': 0.0, 'error': None}
+
+def get_schedule_df():
+    """Devuelve el cronograma compartido, cargándolo de Supabase si aún no está en memoria."""
+    store = schedule_store()
+    with store['lock']:
+        if store['df'] is not None:
+            return store['df']
+    # Una sola lectura en vuelo ('carga'): las demás sesiones esperan ese resultado en vez de repetir la petición,
+    # y 'lock' queda libre para quien ya tiene el cronograma
+    with store['carga']:
+        with store['lock']:
+            if store['df'] is not None:
+                return store['df']
+            if monotonic() < store['fallo_hasta']:
+                st.error(store['error'])
+                return pd.DataFrame()
+        # Lectura directa: la tabla completa ya vive aquí, no se duplica como Parquet en cache_data
+        try:
+            df = normalize_schedule_df(read_schedule_pages())
+        except Exception as e:
+            error = f"Error de conexión con Supabase DB: No se pudo encontrar la tabla 'cronograma'. Detalle: {e}"
+            with store['lock']:
+                store['fallo_hasta'], store['error'] = monotonic() + ESPERA_REINTENTO_SEG, error
+            st.error(error)
+            return pd.DataFrame()
+        with store['lock']:
+            store['df'] = df  # también si está vacío: una tabla vacía no se vuelve a consultar en cada rerun
+            return df
+
+def append_to_schedule_df(rows):
+    """Añade al cronograma compartido las filas recién insertadas."""
+    store = schedule_store()
+    with store['lock']:
+        if store['df'] is not None:
+            store['df'] = append_schedule_rows(store['df'], rows)
+
+def remove_from_schedule_df(programa, bases):
+    """Quita del cronograma compartido las sesiones de la clase eliminada (por programa e ID base)."""
+    store = schedule_store()
+    with store['lock']:
+        df = store['df']
+        if df is not None and not df.empty:
+            # El ID base no incluye el programa: el mismo curso en otro programa comparte la base y se conserva
+            eliminadas = df['id_base'].isin(bases) & (df['Programa'].astype(str) == programa)
+            df = df[~eliminadas].reset_index(drop=True)
+            # Sin categorías huérfanas, para que los filtros no ofrezcan valores ya inexistentes
+            for col in COLUMNAS_CATEGORICAS + ['id_base']:
+                if col in df.columns:
+                    df[col] = df[col].cat.remove_unused_categories()
+            store['df'] = df
+
+def reset_schedule_df():
+    """Descarta la copia compartida para que la próxima lectura la recargue de Supabase."""
+    store = schedule_store()
+    with store['lock']:
+        store['df'], store['fallo_hasta'] = None, 0.0
+
+def get_delete_options(df):
+    """Etiquetas de clase -> (programa, IDs base sin '-S<n>') para el formulario de eliminación, una vez por versión del cronograma."""
+    store = schedule_store()
+    with store['lock']:
+        cached = store['opciones_eliminar']
+        if cached is not None and cached[0] is df:
+            return cached[1]  # cada inserción o eliminación crea un DataFrame nuevo, así que la identidad basta
+        clases = {}
+        if not df.empty:
+            unique_classes = df[['Nombre de la clase', '# de Catalogo', 'Programa', 'id_base']].drop_duplicates()
+            etiquetas = (unique_classes['Nombre de la clase'].astype(str) + ' (' + unique_classes['# de Catalogo'].astype(str)
+                         + ' - ' + unique_classes['Programa'].astype(str) + ')')
+            for etiqueta, programa, base in zip(etiquetas, unique_classes['Programa'].astype(str), unique_classes['id_base']):
+                clases.setdefault(etiqueta, (programa, set()))[1].add(base)
+        clases = dict(sorted(clases.items()))
+        store['opciones_eliminar'] = (df, clases)
+        return clases
 
-if 'schedule_df' not in st.session_state:
-    st.session_state.schedule_df = load_schedule_data()
+schedule_df = get_schedule_df()
 
 # --- Funciones de Validación ---
+def _time_to_minutes(values):
+    """Convierte una secuencia de objetos time a minutos desde medianoche (-1 si falta)."""
+    return np.array([-1 if pd.isna(t) else t.hour * 60 + t.minute for t in values], dtype=np.int16)
+
+def _date_to_days(values):
+    """Convierte una secuencia de objetos date a días desde 1970-01-01 (int32)."""
+    return np.asarray(values, dtype=object).astype('datetime64[D]').astype(np.int32)
+
 def check_self_overlap(df):
     """Verifica si hay cruces de horario dentro de las sesiones que se están creando."""
     conflicts = []
-    for (idx1, row1), (idx2, row2) in itertools.combinations(df.iterrows(), 2):
-        if row1['Fecha'] == row2['Fecha']:
-            if (row1['Hora de inicio'] < row2['Hora de finalizacion']) and (row2['Hora de inicio'] < row1['Hora de finalizacion']):
-                conflicts.append(f"🔥 **Cruce Interno:** La sesión {idx1 + 1} y la sesión {idx2 + 1} se solapan el mismo día ({row1['Fecha']}).")
+    if len(df) < 2:
+        return conflicts  # una sola sesión no puede cruzarse consigo misma
+    fechas = df['Fecha'].to_numpy()
+    dias = _date_to_days(fechas)
+    inicio = _time_to_minutes(df['Hora de inicio'])
+    fin = _time_to_minutes(df['Hora de finalizacion'])
+    # Pares (i < j) del mismo día cuyos intervalos se cruzan, en el mismo orden que itertools.combinations
+    cruce = np.triu(
+        (dias[:, None] == dias[None, :]) & (inicio[:, None] < fin[None, :]) & (inicio[None, :] < fin[:, None]),
+        k=1
+    )
+    idx = df.index.to_numpy()
+    for i, j in np.argwhere(cruce):
+        conflicts.append(f"🔥 **Cruce Interno:** La sesión {idx[i] + 1} y la sesión {idx[j] + 1} se solapan el mismo día ({fechas[i]}).")
     return conflicts
 
+def build_interval_index(df, keys, mask=None):
+    """Agrupa las sesiones por `keys` y ordena cada grupo por hora de inicio para consultas por búsqueda binaria."""
+    filas = np.arange(len(df)) if mask is None else np.flatnonzero(mask)
+    inicio = df['inicio_min'].to_numpy()[filas]
+    fin = df['fin_min'].to_numpy()[filas]
+    index = {}
+    # Solo se agrupan las columnas clave, sin copiar el resto del DataFrame
+    for key, pos in df[keys].iloc[filas].groupby(keys, observed=True, sort=False).indices.items():
+        pos = pos[np.argsort(inicio[pos], kind='stable')]
+        # El máximo acumulado del fin permite descartar de una vez todo lo que termina antes del inicio buscado
+        index[key] = (filas[pos], inicio[pos], np.maximum.accumulate(fin[pos]), fin[pos])
+    return index
+
+def first_overlaps(index, new_df, keys, inicio, fin, mask=None):
+    """Para cada sesión nueva, primera fila existente (en orden original) de su grupo que se solapa con [inicio, fin), o -1."""
+    primera = np.full(len(new_df), -1)
+    filas_nuevas = np.arange(len(new_df)) if mask is None else np.flatnonzero(mask)
+    for key, pos in new_df[keys].iloc[filas_nuevas].groupby(keys, sort=False).indices.items():
+        grupo = index.get(key)
+        if grupo is None:
+            continue
+        filas, g_inicio, g_fin_max, g_fin = grupo
+        pos = filas_nuevas[pos]
+        # Búsqueda binaria en bloque para todas las sesiones nuevas del grupo
+        lo = np.searchsorted(g_fin_max, inicio[pos], side='right')
+        hi = np.searchsorted(g_inicio, fin[pos], side='left')
+        for k in np.flatnonzero(lo < hi):
+            candidatas = filas[lo[k]:hi[k]][g_fin[lo[k]:hi[k]] > inicio[pos[k]]]
+            if candidatas.size:
+                primera[pos[k]] = candidatas.min()
+    return primera
+
 def check_db_conflicts(new_class_df, existing_df):
     """Verifica conflictos de las nuevas sesiones contra el cronograma ya existente en la base de datos."""
     conflicts = []
     if existing_df.empty:
         return conflicts
-    for _, row in new_class_df.iterrows():
-        day_schedule = existing_df[existing_df['Fecha'] == row['Fecha']]
-        if day_schedule.empty:
-            continue
-        # Conflicto de Profesor
-        prof_conflict = day_schedule[
-            (day_schedule['Profesor'] == row['Profesor']) &
-            (day_schedule['Hora de inicio'] < row['Hora de finalizacion']) &
-            (day_schedule['Hora de finalizacion'] > row['Hora de inicio'])
-        ]
-        if not prof_conflict.empty:
-            info = prof_conflict.iloc[0]
+
+    new_ini = _time_to_minutes(new_class_df['Hora de inicio'])
+    new_fin = _time_to_minutes(new_class_df['Hora de finalizacion'])
+    new_no_simultaneo = ~new_class_df['Simultaneo'].to_numpy(dtype=bool)
+    # Claves de las sesiones nuevas con la fecha como entero, igual que 'fecha_dia' en el cronograma
+    new_claves = new_class_df[['Profesor', 'Programa', 'Semestre']].assign(fecha_dia=_date_to_days(new_class_df['Fecha']))
+
+    # Índices por (Fecha, Profesor) y por (Fecha, Programa, Semestre): cada consulta es O(log M + k)
+    prof_index = build_interval_index(existing_df, ['fecha_dia', 'Profesor'])
+    prof_first = first_overlaps(prof_index, new_claves, ['fecha_dia', 'Profesor'], new_ini, new_fin)
+    # Conflicto de Estudiantes solo entre clases que no permiten simultaneidad (si todas la permiten, no se indexa)
+    stud_first = np.full(len(new_class_df), -1)
+    if new_no_simultaneo.any():
+        stud_index = build_interval_index(existing_df, ['fecha_dia', 'Programa', 'Semestre'], mask=(existing_df['Simultaneo'] == False).to_numpy())
+        stud_first = first_overlaps(stud_index, new_claves, ['fecha_dia', 'Programa', 'Semestre'], new_ini, new_fin, mask=new_no_simultaneo)
+    prof_hit, stud_hit = prof_first >= 0, stud_first >= 0
+
+    # Solo se formatean los mensajes de las sesiones con conflicto, leyendo columnas ya extraídas (sin .iloc por fila)
+    nuevas = {col: new_class_df[col].to_numpy() for col in ('Profesor', 'Programa', 'Fecha')}
+    existentes = {col: existing_df[col].to_numpy() for col in ('Nombre de la clase', 'Semestre', 'Hora de inicio', 'Hora de finalizacion')}
+    for i in np.flatnonzero(prof_hit | stud_hit):
+        fecha = nuevas['Fecha'][i].strftime('%Y-%m-%d')
+        if prof_hit[i]:
+            j = prof_first[i]
             conflicts.append(
-                f"❌ **Cruce de Profesor:** El profesor **{row['Profesor']}** ya tiene la clase **'{info['Nombre de la clase']}'** "
-                f"el **{row['Fecha'].strftime('%Y-%m-%d')}** de {info['Hora de inicio'].strftime('%H:%M')} a {info['Hora de finalizacion'].strftime('%H:%M')}."
+                f"❌ **Cruce de Profesor:** El profesor **{nuevas['Profesor'][i]}** ya tiene la clase **'{existentes['Nombre de la clase'][j]}'** "
+                f"el **{fecha}** de {existentes['Hora de inicio'][j].strftime('%H:%M')} a {existentes['Hora de finalizacion'][j].strftime('%H:%M')}."
+            )
+        if stud_hit[i]:
+            j = stud_first[i]
+            conflicts.append(
+                f"❌ **Cruce de Estudiantes:** El programa **{nuevas['Programa'][i]}** (Sem. {existentes['Semestre'][j]}) ya tiene la clase "
+                f"**'{existentes['Nombre de la clase'][j]}'** el **{fecha}** de "
+                f"{existentes['Hora de inicio'][j].strftime('%H:%M')} a {existentes['Hora de finalizacion'][j].strftime('%H:%M')}."
             )
-
-        # Conflicto de Estudiantes (si la clase no permite simultaneidad)
-        if not row['Simultaneo']:
-            student_conflict = day_schedule[
-                (day_schedule['Programa'] == row['Programa']) &
-                (day_schedule['Semestre'] == row['Semestre']) &
-                (day_schedule['Hora de inicio'] < row['Hora de finalizacion']) &
-                (day_schedule['Hora de finalizacion'] > row['Hora de inicio']) &
-                (day_schedule['Simultaneo'] == False)
-            ]
-            if not student_conflict.empty:
-                info = student_conflict.iloc[0]
-                conflicts.append(
-                    f"❌ **Cruce de Estudiantes:** El programa **{row['Programa']}** (Sem. {info['Semestre']}) ya tiene la clase "
-                    f"**'{info['Nombre de la clase']}'** el **{row['Fecha'].strftime('%Y-%m-%d')}** de "
-                    f"{info['Hora de inicio'].strftime('%H:%M')} a {info['Hora de finalizacion'].strftime('%H:%M')}."
-                )
     return conflicts
 
 # --- Funciones Auxiliares ---
-def format_for_display(df):
-    """Formatea el DataFrame para una mejor visualización en Streamlit."""
-    df_display = df.copy()
-    if 'Fecha' in df_display.columns:
-        df_display['Fecha'] = pd.to_datetime(df_display['Fecha']).dt.strftime('%Y-%m-%d')
-    for col in ['Hora de inicio', 'Hora de finalizacion']:
-        if col in df_display.columns and not df_display[col].empty:
-            df_display[col] = df_display[col].apply(lambda x: x.strftime('%H:%M') if pd.notnull(x) else '')
-    return df_display
+# Estilo común de los gráficos (constante de módulo, no se reconstruye en cada rerun)
+ESTILO_GRAFICOS = dict(
+    plot_bgcolor='#262730',
+    paper_bgcolor='#0E1117',
+    font_color='white',
+    title_font_color='#D4AF37'
+)
+HOVER_TIMELINE = (
+    "<b>%{y}</b><br>"
+    "Programa: %{marker.color}<br>"
+    "Profesor: %{customdata[0]}<br>"
+    "Inicio: %{base|%Y-%m-%d %H:%M}<br>"
+    "Fin: %{x|%Y-%m-%d %H:%M}<extra></extra>"
+)
+
+# Formato de fecha/hora delegado al cliente (sin formatear celda por celda en el servidor)
+CONFIG_COLUMNAS_TABLA = {
+    'Fecha': st.column_config.DateColumn(format='YYYY-MM-DD'),
+    'Hora de inicio': st.column_config.TimeColumn(format='HH:mm'),
+    'Hora de finalizacion': st.column_config.TimeColumn(format='HH:mm'),
+}
+
+def df_to_csv_bytes(df):
+    """Serializa el DataFrame a CSV (UTF-8) por bloques, sin las columnas internas."""
+    buffer = BytesIO()
+    df.drop(columns=COLUMNAS_INTERNAS, errors='ignore').to_csv(buffer, index=False, encoding='utf-8', chunksize=10_000)
+    return buffer.getvalue()
+
+# Columnas que usan los gráficos (la caché solo hashea estas)
+COLUMNAS_GRAFICOS = ['fecha_dia', 'inicio_min', 'fin_min', 'Nombre de la clase', 'Programa', 'Profesor', 'Semestre']
+
+@st.cache_data(max_entries=20)
+def build_schedule_figures(df_for_plot):
+    """Construye las figuras de timeline y Gantt; se reutilizan mientras la vista filtrada no cambie."""
+    import plotly.express as px  # import diferido: solo se paga cuando hay datos que graficar
+    import plotly.graph_objects as go
+    df_for_plot = df_for_plot.copy()
+    # Aritmética datetime64 directa: día + minutos, sin parsear fechas ni construir cadenas
+    fechas_plot = df_for_plot['fecha_dia'].to_numpy().astype('datetime64[D]')
+    df_for_plot['start'] = fechas_plot + df_for_plot['inicio_min'].to_numpy().astype('timedelta64[m]')
+    df_for_plot['end'] = fechas_plot + df_for_plot['fin_min'].to_numpy().astype('timedelta64[m]')
+    dfp = df_for_plot.sort_values(by="start")
+    
+    # Una sola construcción con px (la parte costosa); el Gantt parte de una copia de la misma figura
+    fig_timeline = px.timeline(
+        dfp,
+        x_start="start",
+        x_end="end",
+        y="Nombre de la clase",     # ← cada clase en su propia fila (menos solape)
+        color="Programa",
+        # ¡OJO!: NO ponemos 'text=' para evitar solapes
+        hover_data=['Profesor', 'Semestre']  # customdata[0] = Profesor (HOVER_TIMELINE), [1] = Semestre (Gantt)
+    )
+    fig_gantt = go.Figure(fig_timeline)  # copia profunda, conserva el hover por defecto de px
+    
+    # Altura dinámica: ~26px por clase (mín. 450px)
+    row_height = 26
+    
+    # Estilo Gantt y apariencia
+    fig_timeline.update_yaxes(autorange="reversed")  # Gantt-style
+    fig_timeline.update_traces(text=None, cliponaxis=False)
+    
+    fig_timeline.update_layout(
+        height=max(450, row_height * dfp['Nombre de la clase'].nunique()),
+        xaxis=dict(
+            range=[pd.Timestamp(min_date), pd.Timestamp(max_date) + pd.Timedelta(days=1)],
+            rangeslider=dict(visible=True),
+            tickformat="%d %b"
+        ),
+        bargap=0.15,
+        hovermode="closest",
+        uirevision='cal',           # conserva zoom/rango entre reruns
+        margin=dict(l=10, r=10, t=50, b=10),
+        **ESTILO_GRAFICOS
+    )
+    
+    # Hover más claro
+    fig_timeline.update_traces(hovertemplate=HOVER_TIMELINE)
+    
+    fig_gantt.update_layout(
+        title="Duración de Clases Individuales",
+        margin=None,                # el margen superior de px es para figuras sin título
+        xaxis_title="Fecha", yaxis_title="Clase",
+        uirevision='gantt',
+        **ESTILO_GRAFICOS
+    )
+    return fig_timeline, fig_gantt
+
+# Callbacks: actualizan el estado antes del rerun del clic, sin un segundo st.rerun()
+def generar_campos_sesion():
+    """Fija el número de sesiones a generar con el valor del input."""
+    st.session_state.num_sesiones_a_generar = st.session_state.num_sesiones_a_generar_input
+
+def generar_modulos():
+    """Crea la estructura de módulos con el número indicado en el input."""
+    st.session_state.modulos_a_generar = [{'num_sesiones': 1} for _ in range(st.session_state.num_modulos_input)]
 
 def get_time_options():
     """Genera una lista de opciones de tiempo en intervalos de 30 minutos."""
@@ -258,6 +645,23 @@ def get_time_options():
     times.append(time(19, 0))
     return times
 
+# Las opciones de hora no cambian: se calculan una vez, con sus minutos para buscar la más cercana
+OPCIONES_HORA = get_time_options()
+MINUTOS_OPCIONES_HORA = np.array([t.hour * 60 + t.minute for t in OPCIONES_HORA])
+
+def time_option_index(t):
+    """Índice de la opción de hora igual o más cercana a `t` (8:00 si no es una hora)."""
+    if not isinstance(t, time):
+        return 2  # 8:00
+    minutes = t.hour * 60 + t.minute
+    pos = int(np.searchsorted(MINUTOS_OPCIONES_HORA, minutes))
+    if pos == 0:
+        return 0
+    if pos == len(MINUTOS_OPCIONES_HORA):
+        return pos - 1
+    # En empate gana la opción anterior, como con min() sobre los índices
+    return pos - 1 if minutes - MINUTOS_OPCIONES_HORA[pos - 1] <= MINUTOS_OPCIONES_HORA[pos] - minutes else pos
+
 # --- Inicialización del Estado de la Sesión ---
 if 'page_mode' not in st.session_state:
     st.session_state.page_mode = 'select'  # 'select' o 'create'
@@ -275,16 +679,6 @@ if 'prefill_profesor' not in st.session_state:
 # --- INTERFAZ DE USUARIO (UI) ---
 st.title("🗓️ Organizador de Cronogramas de Posgrado")
 
-# --- Barra Lateral de Filtros ---
-st.sidebar.header("Filtros y Opciones")
-programas_list_filter = get_unique_values_from_db('Programa')
-profesores_list_filter_db = get_unique_values_from_db('Profesor')
-semestres_list_filter = get_unique_values_from_db('Semestre')
-
-st.sidebar.multiselect("Filtrar por Programa", options=programas_list_filter, key="programa_filtro")
-st.sidebar.multiselect("Filtrar por Profesor", options=profesores_list_filter_db, key="profesor_filtro")
-st.sidebar.multiselect("Filtrar por Semestre", options=semestres_list_filter, format_func=lambda x: f"Semestre {x}", key="semestre_filtro")
-
 # --- PASO 0: SELECCIONAR O CREAR CURSO ---
 st.header("➕ Añadir Nueva Clase")
 
@@ -303,35 +697,23 @@ with st.container(border=True):
             st.error("El archivo de currículo no está disponible. No se pueden cargar cursos existentes.")
         else:
             sel_col1, sel_col2 = st.columns(2)
-            # Programas y semestres del currículo
-            programas_curriculo = sorted(curriculum_df['Programa'].dropna().unique())
+            # Programas y semestres del currículo (índice precalculado al cargarlo)
+            programas_curriculo = list(curriculum_index)
             selected_program = sel_col1.selectbox("Selecciona el Programa", options=programas_curriculo, index=0)
 
-            semestres_curriculo = sorted(curriculum_df[curriculum_df['Programa'] == selected_program]['Semestre'].dropna().unique())
+            semestres_programa = curriculum_index.get(selected_program, {})
+            semestres_curriculo = list(semestres_programa)
             if len(semestres_curriculo) == 0:
                 st.warning("El programa seleccionado no tiene semestres disponibles en el Excel.")
                 semestres_curriculo = [1]
             selected_semester = sel_col2.selectbox("Selecciona el Semestre", options=semestres_curriculo, index=0)
 
-            # Filtrado de clases
-            filtered = curriculum_df[
-                (curriculum_df['Programa'] == selected_program) &
-                (curriculum_df['Semestre'] == int(selected_semester))
-            ].copy()
+            # Filas y clases únicas del programa/semestre seleccionados
+            filtered, unique_classes = semestres_programa.get(int(selected_semester), (curriculum_df.iloc[0:0], None))
 
             if filtered.empty:
                 st.warning("No hay filas para el programa/semestre seleccionados.")
             else:
-                # Opciones únicas por (Nombre, #Catálogo)
-                unique_classes = (
-                    filtered[['Nombre de la clase', '# de Catalogo']]
-                    .dropna()
-                    .drop_duplicates()
-                    .sort_values(by=['Nombre de la clase', '# de Catalogo'])
-                )
-                unique_classes['label'] = unique_classes.apply(
-                    lambda r: f"{r['Nombre de la clase']} (Catálogo {r['# de Catalogo']})", axis=1
-                )
                 class_labels = unique_classes['label'].tolist()
                 selected_label = st.selectbox("Selecciona la Clase", options=class_labels)
 
@@ -348,26 +730,28 @@ with st.container(border=True):
                     if 'Nombre profesor' in course_rows.columns:
                         vc = course_rows['Nombre profesor'].replace('', pd.NA).dropna()
                         if not vc.empty:
-                            prefill_prof = vc.value_counts().idxmax()
+                            prefill_prof = Counter(vc.tolist()).most_common(1)[0][0]
 
                     # Prefill contrato (si Excel trae Descripción.2)
                     prefill_contrato = ""
                     if 'Descripción.2' in course_rows.columns:
                         cc = course_rows['Descripción.2'].replace('', pd.NA).dropna()
                         if not cc.empty:
-                            prefill_contrato = str(cc.value_counts().idxmax()).strip()
+                            prefill_contrato = str(Counter(cc.tolist()).most_common(1)[0][0]).strip()
 
                     # Prefill sesiones desde F Reunión, Hora Inicio/Final (acotadas al semestre fijo)
                     sessions = []
                     course_rows = course_rows.sort_values(by='F Reunión')
-                    for _, r in course_rows.iterrows():
-                        fecha_raw = None if pd.isna(r['F Reunión']) else r['F Reunión'].date()
+                    for f_reunion, h_inicio, h_final in zip(
+                        course_rows['F Reunión'], course_rows['Hora Inicio'], course_rows['Hora Final']
+                    ):
+                        fecha_raw = None if pd.isna(f_reunion) else f_reunion.date()
                         if fecha_raw is None:
                             continue
                         # Acotar a los límites del semestre
                         fecha = min(max(fecha_raw, min_date), max_date)
-                        hi = r['Hora Inicio'] if pd.notna(r['Hora Inicio']) else None
-                        hf = r['Hora Final'] if pd.notna(r['Hora Final']) else None
+                        hi = h_inicio if pd.notna(h_inicio) else None
+                        hf = h_final if pd.notna(h_final) else None
                         if (hi is not None) and (hf is not None):
                             dur = datetime.combine(date.today(), hf) - datetime.combine(date.today(), hi)
                             dur_horas = max(1, int(round(dur.total_seconds() / 3600)))
@@ -500,16 +884,12 @@ with st.container(border=True):
 
     if tipo_clase == "Regular":
         default_ses = st.session_state.get('num_sesiones_a_generar', 1)
-        num_sesiones_a_generar = st.number_input("Número de Sesiones a generar", min_value=1, step=1, format="%d",
-                                                 key="num_sesiones_a_generar_input", value=default_ses, disabled=is_disabled_for_empty_select)
-        if st.button("Generar Campos de Sesión"):
-            st.session_state.num_sesiones_a_generar = num_sesiones_a_generar
-            st.rerun()
+        st.number_input("Número de Sesiones a generar", min_value=1, step=1, format="%d",
+                        key="num_sesiones_a_generar_input", value=default_ses, disabled=is_disabled_for_empty_select)
+        st.button("Generar Campos de Sesión", on_click=generar_campos_sesion)
     else:  # Modular
-        num_modulos = st.number_input("Número de Módulos", min_value=1, step=1, format="%d", key="num_modulos_input", disabled=is_disabled_for_empty_select)
-        if st.button("Generar Módulos"):
-            st.session_state.modulos_a_generar = [{'num_sesiones': 1} for _ in range(num_modulos)]
-            st.rerun()
+        st.number_input("Número de Módulos", min_value=1, step=1, format="%d", key="num_modulos_input", disabled=is_disabled_for_empty_select)
+        st.button("Generar Módulos", on_click=generar_modulos)
 
 # --- Formulario de Sesiones ---
 with st.form("new_class_form"):
@@ -520,13 +900,11 @@ with st.form("new_class_form"):
     opciones_profesor = ["--- Seleccione un profesor ---"]
     prof_contrato_map = {}
     if not professors_df.empty:
-        cols_ok = all(c in professors_df.columns for c in ['Profesor', 'Contrato'])
-        if not cols_ok:
+        if profesores_catalogo is None:
             st.warning("El archivo 'profesores.csv' debe contener columnas 'Profesor' y 'Contrato'.")
         else:
-            unique_professors = professors_df.dropna(subset=['Profesor']).drop_duplicates(subset=['Profesor'])
-            opciones_profesor += sorted(unique_professors['Profesor'].astype(str).tolist())
-            prof_contrato_map = pd.Series(unique_professors['Contrato'].astype(str).values, index=unique_professors['Profesor'].astype(str)).to_dict()
+            profesores_lista, prof_contrato_map = profesores_catalogo  # precalculados al cargar el CSV
+            opciones_profesor += profesores_lista
 
     if st.session_state.tipo_clase == "Regular":
         # Prefill profesor y contrato si viene del Excel
@@ -552,15 +930,6 @@ with st.form("new_class_form"):
         )
 
         st.markdown("---")
-        time_opts = get_time_options()
-        def _time_index_or_default(t):
-            if isinstance(t, time) and t in time_opts:
-                return time_opts.index(t)
-            if isinstance(t, time):
-                minutes = t.hour * 60 + t.minute
-                closest = min(range(len(time_opts)), key=lambda i: abs((time_opts[i].hour*60 + time_opts[i].minute) - minutes))
-                return closest
-            return 2  # 8:00
 
         prefill_ses = st.session_state.prefill_sesiones or []
         n = st.session_state.get('num_sesiones_a_generar', 1)
@@ -582,7 +951,7 @@ with st.form("new_class_form"):
                 def_dur = 2
 
             fecha = s_col1.date_input("Fecha", value=def_fecha, min_value=min_date, max_value=max_date, key=f"reg_date_{i}")
-            hora_inicio = s_col2.selectbox("Inicio", options=time_opts, index=_time_index_or_default(def_inicio),
+            hora_inicio = s_col2.selectbox("Inicio", options=OPCIONES_HORA, index=time_option_index(def_inicio),
                                            format_func=lambda t: t.strftime('%H:%M'), key=f"reg_start_{i}")
             duracion = s_col3.number_input("Duración (horas enteras)", min_value=1, step=1, value=int(def_dur), key=f"reg_dur_{i}")
 
@@ -626,7 +995,7 @@ with st.form("new_class_form"):
                 st.markdown(f"**Sesión {j + 1} del Módulo {i + 1}**")
                 ms_col1, ms_col2, ms_col3 = st.columns(3)
                 fecha = ms_col1.date_input("Fecha", value=min_date, min_value=min_date, max_value=max_date, key=f"mod_date_{i}_{j}")
-                hora_inicio = ms_col2.selectbox("Inicio", options=get_time_options(), index=2, format_func=lambda t: t.strftime('%H:%M'), key=f"mod_start_{i}_{j}")
+                hora_inicio = ms_col2.selectbox("Inicio", options=OPCIONES_HORA, index=2, format_func=lambda t: t.strftime('%H:%M'), key=f"mod_start_{i}_{j}")
                 duracion = ms_col3.number_input("Duración (horas enteras)", min_value=1, step=1, value=2, key=f"mod_dur_{i}_{j}")
                 
                 hora_fin = (datetime.combine(date.today(), hora_inicio) + pd.Timedelta(hours=duracion)).time()
@@ -655,151 +1024,132 @@ if submit_button:
     elif any(not s['Profesor'] for s in sesiones_data):
         st.error("Error: Todas las sesiones o módulos deben tener un profesor seleccionado de la lista.")
     else:
-        temp_df = pd.DataFrame(sesiones_data)
-        self_conflicts = check_self_overlap(temp_df)
+        # Valores comunes a todas las sesiones, convertidos una sola vez
+        id_base = f"{catalogo}-{nombre_clase.replace(' ', '')[:5]}"
+        datos_clase = {
+            'Descripción': descripcion,
+            '# de Catalogo': catalogo,
+            'Nombre de la clase': nombre_clase,
+            'Programa': programa,
+            'Semestre': int(semestre),
+            'Creditos': int(creditos),
+            'Simultaneo': simultaneo,
+            'Estudiantes Estimados': int(num_estudiantes),
+            'Requerimientos Espacio': req_espacio,
+            'Centro_costo_programa': int(centro_costo_programa),
+        }
+        # Un único DataFrame con las sesiones a registrar, usado por ambas validaciones
+        records = [{
+            'ID': f"{id_base}-S{s['Sesión']}",
+            **datos_clase,
+            'Profesor': s['Profesor'],
+            'Tipo de Contrato': s['Tipo de Contrato'],
+            'Módulo': s['Módulo'],
+            'Sesión': s['Sesión'],
+            'Fecha': s['Fecha'],
+            'Hora de inicio': s['Hora de inicio'],
+            'Hora de finalizacion': s['Hora de finalizacion']
+        } for s in sesiones_data]
+        final_df = pd.DataFrame(records)
+        self_conflicts = check_self_overlap(final_df)
         if self_conflicts:
             st.error("No se pudo añadir. Se encontraron cruces entre las sesiones que intentas registrar:")
             for c in self_conflicts:
                 st.warning(c)
         else:
-            records = [{
-                'ID': f"{catalogo}-{nombre_clase.replace(' ', '')[:5]}-S{s['Sesión']}",
-                'Descripción': descripcion,
-                '# de Catalogo': catalogo,
-                'Nombre de la clase': nombre_clase,
-                'Programa': programa,
-                'Semestre': int(semestre),
-                'Creditos': int(creditos),
-                'Profesor': s['Profesor'],
-                'Tipo de Contrato': s['Tipo de Contrato'],
-                'Simultaneo': simultaneo,
-                'Estudiantes Estimados': int(num_estudiantes),
-                'Requerimientos Espacio': req_espacio,
-                'Centro_costo_programa': int(centro_costo_programa),
-                'Módulo': s['Módulo'],
-                'Sesión': s['Sesión'],
-                'Fecha': s['Fecha'],
-                'Hora de inicio': s['Hora de inicio'],
-                'Hora de finalizacion': s['Hora de finalizacion']
-            } for s in sesiones_data]
-            
-            final_df = pd.DataFrame(records)
-            db_conflicts = check_db_conflicts(final_df, st.session_state.schedule_df)
+            # Solo se descargan las sesiones candidatas de las mismas fechas; si falla, se valida contra la copia local
+            try:
+                ventana = (final_df['Hora de inicio'].min(), final_df['Hora de finalizacion'].max())
+                existing_df = fetch_schedule_for_dates(sorted(set(final_df['Fecha'])), ventana)
+            except Exception as e:
+                st.warning(f"No se pudo consultar Supabase; los cruces se validan contra la copia local del cronograma. Detalle: {e}")
+                existing_df = schedule_df
+            db_conflicts = check_db_conflicts(final_df, existing_df)
             
             if db_conflicts:
                 st.error("No se pudo añadir. Se encontraron conflictos con el cronograma existente:")
                 for c in db_conflicts:
                     st.warning(c)
             else:
-                # Convertir a string para la inserción en Supabase
-                final_df['Fecha'] = final_df['Fecha'].astype(str)
-                final_df['Hora de inicio'] = final_df['Hora de inicio'].astype(str)
-                final_df['Hora de finalizacion'] = final_df['Hora de finalizacion'].astype(str)
+                # Serializar fechas y horas directamente desde los registros para la inserción en Supabase
+                payload = [{
+                    **r,
+                    'Fecha': r['Fecha'].isoformat(),
+                    'Hora de inicio': r['Hora de inicio'].strftime('%H:%M:%S'),
+                    'Hora de finalizacion': r['Hora de finalizacion'].strftime('%H:%M:%S')
+                } for r in records]
                 
                 try:
-                    supabase.table('cronograma').insert(final_df.to_dict('records')).execute()
+                    response = supabase.table('cronograma').insert(payload).execute()
                     st.success(f"¡Clase '{nombre_clase}' añadida exitosamente!")
-                    st.cache_data.clear()  # Limpiar caché para recargar los datos
-                    st.session_state.schedule_df = load_schedule_data()
-                    st.rerun()
+                    fetch_schedule_parquet.clear()  # Solo la caché del cronograma (las vistas filtradas)
+                    # Las filas devueltas por el insert se añaden localmente, sin volver a descargar la tabla
+                    if response.data:
+                        append_to_schedule_df(response.data)
+                    else:
+                        reset_schedule_df()
+                    # La vista se dibuja más abajo en esta misma ejecución: basta con tomar el cronograma actualizado
+                    schedule_df = get_schedule_df()
                 except Exception as e:
                     st.error(f"Error al guardar en la base de datos: {e}")
 
+# --- Barra Lateral de Filtros ---
+# Se dibuja después del envío del formulario: así sus opciones ya incluyen la clase recién insertada
+st.sidebar.header("Filtros y Opciones")
+programas_list_filter = get_filter_options(schedule_df, 'Programa')
+profesores_list_filter_db = get_filter_options(schedule_df, 'Profesor')
+semestres_list_filter = get_filter_options(schedule_df, 'Semestre')
+
+# Los filtros se aplican solo al enviar el formulario (un rerun por aplicación, no por selección)
+with st.sidebar.form("filtros_form"):
+    st.multiselect("Filtrar por Programa", options=programas_list_filter, key="programa_filtro")
+    st.multiselect("Filtrar por Profesor", options=profesores_list_filter_db, key="profesor_filtro")
+    st.multiselect("Filtrar por Semestre", options=semestres_list_filter, format_func=lambda x: f"Semestre {x}", key="semestre_filtro")
+    st.form_submit_button("Aplicar filtros")
+
 # --- Visualización del Cronograma y Eliminación ---
 st.markdown("---")
 st.header("📅 Cronograma General de Clases")
 
-if st.session_state.schedule_df.empty:
+if schedule_df.empty:
     st.info("Aún no se han añadido clases al cronograma.")
 else:
-    # Aplicar filtros
-    filtered_df = st.session_state.schedule_df.copy()
-    if st.session_state.programa_filtro:
-        filtered_df = filtered_df[filtered_df['Programa'].isin(st.session_state.programa_filtro)]
-    if st.session_state.profesor_filtro:
-        filtered_df = filtered_df[filtered_df['Profesor'].isin(st.session_state.profesor_filtro)]
-    if st.session_state.semestre_filtro:
-        filtered_df = filtered_df[filtered_df['Semestre'].isin(st.session_state.semestre_filtro)]
+    # Aplicar filtros (en Supabase; sin filtros se usa el cronograma ya cargado)
+    filtros = (
+        tuple(sorted(st.session_state.programa_filtro)),
+        tuple(sorted(st.session_state.profesor_filtro)),
+        tuple(sorted(st.session_state.semestre_filtro)),
+    )
+    if any(filtros):
+        filtered_df = load_schedule_data(*filtros)
+        if filtered_df.empty:
+            filtered_df = schedule_df.iloc[0:0]  # conserva las columnas
+    else:
+        filtered_df = schedule_df
     
-    st.dataframe(format_for_display(filtered_df.sort_values(by="Fecha")), width='stretch')
+    st.dataframe(
+        filtered_df.drop(columns=COLUMNAS_INTERNAS, errors='ignore'),  # ya viene ordenado por Fecha desde Supabase
+        column_config=CONFIG_COLUMNAS_TABLA,
+        width='stretch'
+    )
     
-    # Botones de descarga
-    completo_csv = st.session_state.schedule_df.to_csv(index=False).encode('utf-8')
-    filtrado_csv = filtered_df.to_csv(index=False).encode('utf-8')
+    # Botones de descarga (el CSV solo se genera al hacer clic)
     d_col1, d_col2 = st.columns(2)
-    d_col1.download_button("📥 Descargar Cronograma Completo (CSV)", completo_csv, 'cronograma_completo.csv', 'text/csv')
-    d_col2.download_button("📥 Descargar Vista Filtrada (CSV)", filtrado_csv, 'cronograma_filtrado.csv', 'text/csv')
+    d_col1.download_button("📥 Descargar Cronograma Completo (CSV)", partial(df_to_csv_bytes, schedule_df), 'cronograma_completo.csv', 'text/csv', on_click='ignore')
+    d_col2.download_button("📥 Descargar Vista Filtrada (CSV)", partial(df_to_csv_bytes, filtered_df), 'cronograma_filtrado.csv', 'text/csv', on_click='ignore')
     
     # --- Visualizaciones Gráficas ---
     st.markdown("---")
     st.header("📊 Visualizaciones del Cronograma")
 
     if not filtered_df.empty:
-        df_for_plot = filtered_df.copy()
-        df_for_plot['start'] = df_for_plot.apply(lambda row: pd.to_datetime(f"{row['Fecha']} {row['Hora de inicio']}"), axis=1)
-        df_for_plot['end'] = df_for_plot.apply(lambda row: pd.to_datetime(f"{row['Fecha']} {row['Hora de finalizacion']}"), axis=1)
+        fig_timeline, fig_gantt = build_schedule_figures(filtered_df[COLUMNAS_GRAFICOS])
 
         # --- 🗓️ Vista de Calendario (Timeline) sin solape de textos ---
         st.subheader("🗓️ Vista de Calendario (Timeline)")
-        
-        dfp = df_for_plot.sort_values(by="start").copy()
-        
-        # Altura dinámica: ~26px por clase (mín. 450px)
-        row_height = 26
-        fig_timeline = px.timeline(
-            dfp,
-            x_start="start",
-            x_end="end",
-            y="Nombre de la clase",     # ← cada clase en su propia fila (menos solape)
-            color="Programa",
-            # ¡OJO!: NO ponemos 'text=' para evitar solapes
-            hover_data=['Programa', 'Profesor', 'Semestre', 'Módulo', 'Fecha']
-        )
-        
-        # Estilo Gantt y apariencia
-        fig_timeline.update_yaxes(autorange="reversed")  # Gantt-style
-        fig_timeline.update_traces(text=None, cliponaxis=False)
-        
-        fig_timeline.update_layout(
-            height=max(450, row_height * dfp['Nombre de la clase'].nunique()),
-            xaxis=dict(
-                range=[pd.Timestamp(min_date), pd.Timestamp(max_date) + pd.Timedelta(days=1)],
-                rangeslider=dict(visible=True),
-                tickformat="%d %b"
-            ),
-            bargap=0.15,
-            hovermode="closest",
-            plot_bgcolor='#262730',
-            paper_bgcolor='#0E1117',
-            font_color='white',
-            title_font_color='#D4AF37',
-            margin=dict(l=10, r=10, t=50, b=10)
-        )
-        
-        # Hover más claro
-        fig_timeline.update_traces(
-            hovertemplate="<b>%{y}</b><br>" +
-                          "Programa: %{marker.color}<br>" +
-                          "Profesor: %{customdata[0]}<br>" +
-                          "Inicio: %{base|%Y-%m-%d %H:%M}<br>" +
-                          "Fin: %{x|%Y-%m-%d %H:%M}<extra></extra>"
-        )
-        
         st.plotly_chart(fig_timeline, width='stretch')
         
         st.subheader("📊 Diagrama de Gantt por Clase")
-        fig_gantt = px.timeline(
-            df_for_plot.sort_values(by="start"),
-            x_start="start", x_end="end", y="Nombre de la clase",
-            color="Programa",
-            title="Duración de Clases Individuales",
-            hover_data=['Profesor', 'Semestre']
-        )
-        fig_gantt.update_layout(
-            xaxis_title="Fecha", yaxis_title="Clase",
-            plot_bgcolor='#262730', paper_bgcolor='#0E1117',
-            font_color='white', title_font_color='#D4AF37'
-        )
         st.plotly_chart(fig_gantt, width='stretch')
     else:
         st.warning("No hay datos para mostrar en las visualizaciones con los filtros actuales.")
@@ -808,19 +1158,26 @@ else:
     st.markdown("---")
     st.header("🗑️ Eliminar Clase del Cronograma")
     with st.form("delete_form"):
-        unique_classes = st.session_state.schedule_df[['Nombre de la clase', '# de Catalogo', 'Programa']].drop_duplicates()
-        class_options_delete = [f"{row['Nombre de la clase']} ({row['# de Catalogo']} - {row['Programa']})" for _, row in unique_classes.iterrows()]
+        # Cada opción apunta al programa y a los IDs base de la clase; se recalculan solo cuando cambia el cronograma compartido
+        clases_eliminables = get_delete_options(schedule_df)
         
-        class_to_delete_display = st.selectbox("Selecciona la clase a eliminar", options=sorted(class_options_delete))
+        class_to_delete_display = st.selectbox("Selecciona la clase a eliminar", options=list(clases_eliminables))
         
         if st.form_submit_button("Eliminar Clase"):
             if class_to_delete_display:
                 catalogo_to_delete = class_to_delete_display.split('(')[1].split(' - ')[0]
+                programa_to_delete, bases_to_delete = clases_eliminables[class_to_delete_display]
                 try:
-                    supabase.table('cronograma').delete().like('ID', f'{catalogo_to_delete}%').execute()
+                    # Una sola petición para todas las bases: el borrado se aplica completo o no se aplica.
+                    # El programa acota el borrado: el mismo curso en otro programa comparte el ID base
+                    filtro_ids = session_ids_filter(bases_to_delete)
+                    supabase.table('cronograma').delete().eq('Programa', programa_to_delete).or_(filtro_ids).execute()
                     st.success(f"La clase con catálogo '{catalogo_to_delete}' ha sido eliminada.")
-                    st.cache_data.clear()
-                    st.session_state.schedule_df = load_schedule_data()
+                    fetch_schedule_parquet.clear()  # Solo la caché del cronograma; S3 y figuras se conservan
+                    remove_from_schedule_df(programa_to_delete, bases_to_delete)
                     st.rerun()
                 except Exception as e:
+                    # No se sabe qué alcanzó a borrarse: se descartan las copias para releer la base
+                    fetch_schedule_parquet.clear()
+                    reset_schedule_df()
                     st.error(f"Error al eliminar de la base de datos: {e}")